@@ -1,19 +1,36 @@
+import os
 import tarfile
 from pathlib import Path
 
 import boto3
+import numpy as np
 import xgboost as xgb
 
 
+# Created once so every download reuses the same client and its
+# connection pool
+S3_CLIENT = boto3.client("s3")
+
+# Read size used while streaming the archive from S3
+STREAM_BUFFER_SIZE = 256 * 1024
+
+# Model file names written by SageMaker's XGBoost container
+SAGEMAKER_MODEL_FILES = ["xgboost-model.bst", "xgboost-model"]
+
+
 def download_and_extract_from_s3(bucket, key, dest_dir):
     """
     Downloads a tar.gz file from an AWS S3 bucket and extracts its contents to
     a specified directory.
+
+    The object body is streamed straight into `tarfile` (streaming "r|gz"
+    mode), so download, decompression and extraction overlap and no copy
+    of the archive is written to disk.
     Args:
         bucket (str): Name of the S3 bucket.
         key (str): Key (path) to the tar.gz file in the S3 bucket.
-        dest_dir (Path or str): Destination directory to save and
-            extract the contents.
+        dest_dir (Path or str): Destination directory to extract the
+            contents into.
     Raises:
         Exception: If there is an error downloading the file from S3
             or extracting the tar file.
@@ -21,29 +38,48 @@ def download_and_extract_from_s3(bucket, key, dest_dir):
         Status messages indicating download and extraction progress.
     """
     print(f"Downloading model from s3://{bucket}/{key}")
-    s3 = boto3.client("s3")
-    local_tar = dest_dir / "model.tar.gz"
     try:
-        s3.download_file(bucket, key, str(local_tar))
-        print(f"Downloaded to {local_tar}")
+        obj = S3_CLIENT.get_object(Bucket=bucket, Key=key)
     except Exception as e:
         print(f"Error downloading file from S3: {e}")
         raise
 
     try:
-        with tarfile.open(str(local_tar), "r:gz") as tar:
+        with tarfile.open(
+            fileobj=obj["Body"], mode="r|gz", bufsize=STREAM_BUFFER_SIZE
+        ) as tar:
             tar.extractall(path=str(dest_dir))
-        print("Extracted files:", list(dest_dir.rglob("*")))
+        print(f"Extracted to {dest_dir}")
     except Exception as e:
         print(f"Error extracting tar file: {e}")
         raise
+    finally:
+        obj["Body"].close()
+
+
+def find_bst_model(model_dir: Path):
+    """
+    Finds the model file within a directory.
+    Checks the names SageMaker's XGBoost container uses at the top of the
+    archive first, and only walks the directory tree for a `.bst` file if
+    neither exists.
+    Args:
+        model_dir (Path): Path to the directory to search.
+    Returns:
+        Path or None: The model file, or None if there is none.
+    """
+    for name in SAGEMAKER_MODEL_FILES:
+        model_file = model_dir / name
+        if model_file.is_file():
+            return model_file
+    return next(model_dir.rglob("*.bst"), None)
 
 
 def load_bst_model(model_dir: Path):
     """
     Loads an XGBoost Booster model from a specified directory.
-    Searches recursively for the first `.bst` model file within
-    the given directory, loads the model using XGBoost's Booster,
+    Locates the model file within the given directory with
+    `find_bst_model`, loads the model using XGBoost's Booster,
     and returns the loaded model.
     Args:
         model_dir (Path): Path to the directory containing the
@@ -52,19 +88,198 @@ def load_bst_model(model_dir: Path):
         xgb.Booster: The loaded XGBoost Booster model.
     Raises:
         FileNotFoundError: If the specified model directory does not exist.
-        RuntimeError: If no `.bst` model file is found in the directory.
+        RuntimeError: If no model file is found in the directory.
     """
-    print("Searching for .bst model file in", model_dir)
+    print("Searching for model file in", model_dir)
     if not model_dir.exists():
         raise FileNotFoundError(f"Model directory does not exist: {model_dir}")
-    candidates = list(model_dir.rglob("*.bst"))
-    if not candidates:
-        raise RuntimeError("No .bst model file found in " + str(model_dir))
+    model_file = find_bst_model(model_dir)
+    if model_file is None:
+        raise RuntimeError("No model file found in " + str(model_dir))
 
-    model_file = candidates[0]
     print(f"Loading XGBoost model from {model_file}")
 
     booster = xgb.Booster()
     booster.load_model(str(model_file))
     print("Model loaded successfully")
     return booster
+
+
+def validation_sample(booster, n_rows=1000):
+    """
+    Builds feature rows for checking a converted model against a booster.
+    For each feature, the candidate values are the midpoints between the
+    booster's consecutive split thresholds on that feature, plus one value
+    below the lowest and one above the highest threshold. Every split is
+    therefore reachable on both sides without a value sitting exactly on a
+    threshold. Each row picks one candidate per feature at random.
+    Args:
+        booster (xgb.Booster): The model whose splits to sample around.
+        n_rows (int): Number of rows to generate.
+    Returns:
+        numpy.ndarray: A float32 array of shape (n_rows, n_features).
+    """
+    n_features = booster.num_features()
+    names = booster.feature_names or [f"f{i}" for i in range(n_features)]
+    splits = booster.trees_to_dataframe().groupby("Feature")["Split"].unique()
+
+    rng = np.random.default_rng(0)
+    sample = np.zeros((n_rows, n_features), dtype=np.float32)
+    for i, name in enumerate(names):
+        if name not in splits.index:
+            continue
+        thresholds = np.unique(splits[name])
+        candidates = np.concatenate([
+            [thresholds[0] - 1],
+            (thresholds[:-1] + thresholds[1:]) / 2,
+            [thresholds[-1] + 1]
+        ])
+        sample[:, i] = rng.choice(candidates, size=n_rows)
+    return sample
+
+
+def convert_to_onnx(booster, onnx_file: Path):
+    """
+    Converts an XGBoost Booster to ONNX and saves it.
+    Before the file is written, the converted model is checked against the
+    booster on rows spanning its split thresholds (see
+    `validation_sample`). A conversion that disagrees there is rejected
+    rather than cached.
+    Args:
+        booster (xgb.Booster): The model to convert.
+        onnx_file (Path): Where to write the ONNX model.
+    Raises:
+        RuntimeError: If the converted model's predictions differ from
+            the booster's.
+    """
+    import onnxmltools
+    import onnxruntime as ort
+    from onnxmltools.convert.common.data_types import FloatTensorType
+
+    print(f"Converting XGBoost model to ONNX at {onnx_file}")
+    n_features = booster.num_features()
+    # The converter reads feature indices from the tree dump, which only
+    # works when the booster has no feature names
+    booster = booster.copy()
+    booster.feature_names = None
+    onnx_model = onnxmltools.convert_xgboost(
+        booster, initial_types=[("input", FloatTensorType([None, n_features]))]
+    )
+
+    sample = validation_sample(booster)
+    session = ort.InferenceSession(
+        onnx_model.SerializeToString(), providers=["CPUExecutionProvider"]
+    )
+    expected = booster.inplace_predict(sample)
+    if expected.ndim > 1:
+        expected = expected.argmax(axis=1)
+    if not np.array_equal(session.run(None, {"input": sample})[0], expected):
+        raise RuntimeError("ONNX model predictions differ from XGBoost")
+
+    # A name unique to this process, so concurrent builds of the same
+    # model never write to the same temporary file
+    tmp_file = onnx_file.with_name(f"{onnx_file.stem}.{os.getpid()}.tmp")
+    tmp_file.write_bytes(onnx_model.SerializeToString())
+    tmp_file.replace(onnx_file)
+
+
+def load_onnx_model(model_dir: Path, n_threads=1):
+    """
+    Loads the model in a directory as an ONNX Runtime inference session.
+    The `.bst` model is converted to `model.onnx` on first use and saved in
+    the same directory, so later loads reuse the converted file.
+    Requires `onnxmltools` (for the conversion) and `onnxruntime`, which
+    are installed from requirements-backends.txt rather than by default.
+    Args:
+        model_dir (Path): Path to the directory containing the
+            `.bst` model file.
+        n_threads (int): Number of threads ONNX Runtime uses per run.
+    Returns:
+        onnxruntime.InferenceSession: The loaded model, taking a float32
+            array named "input" and returning the class labels first.
+    """
+    import onnxruntime as ort
+
+    onnx_file = model_dir / "model.onnx"
+    if not onnx_file.exists():
+        convert_to_onnx(load_bst_model(model_dir), onnx_file)
+
+    print(f"Loading ONNX model from {onnx_file}")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = n_threads
+    session = ort.InferenceSession(
+        str(onnx_file), options, providers=["CPUExecutionProvider"]
+    )
+    print("Model loaded successfully")
+    return session
+
+
+def compile_treelite_model(booster, lib_file: Path):
+    """
+    Compiles an XGBoost Booster to a native shared library with Treelite.
+    Before it is moved into place, the compiled model is checked against
+    the booster on rows spanning its split thresholds (see
+    `validation_sample`). A build that disagrees there is rejected rather
+    than cached.
+    Args:
+        booster (xgb.Booster): The model to compile.
+        lib_file (Path): Where to write the shared library.
+    Raises:
+        RuntimeError: If the compiled model's predictions differ from
+            the booster's.
+    """
+    import tl2cgen
+    import treelite
+
+    print(f"Compiling XGBoost model with Treelite to {lib_file}")
+    # A name unique to this process, so concurrent builds of the same
+    # model never write to the same temporary file
+    tmp_file = lib_file.with_name(f"{lib_file.stem}.{os.getpid()}{lib_file.suffix}")
+    try:
+        tl2cgen.export_lib(
+            treelite.frontend.from_xgboost(booster),
+            toolchain="gcc",
+            libpath=str(tmp_file),
+            params={"parallel_comp": os.cpu_count() or 1}
+        )
+
+        sample = validation_sample(booster)
+        predictor = tl2cgen.Predictor(str(tmp_file))
+        actual = predictor.predict(tl2cgen.DMatrix(sample))
+        actual = actual.reshape(len(sample), -1).argmax(axis=1)
+        expected = booster.inplace_predict(sample)
+        if expected.ndim > 1:
+            expected = expected.argmax(axis=1)
+        if not np.array_equal(actual, expected):
+            raise RuntimeError("Treelite model predictions differ from XGBoost")
+
+        tmp_file.replace(lib_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+
+def load_treelite_model(model_dir: Path, n_threads=1):
+    """
+    Loads the model in a directory as a Treelite-compiled predictor.
+    The `.bst` model is compiled to `model.so` on first use and saved in the
+    same directory, so later loads reuse the compiled library. Requires
+    `treelite` and `tl2cgen` from requirements-backends.txt, plus gcc for
+    the first compilation.
+    Args:
+        model_dir (Path): Path to the directory containing the
+            `.bst` model file.
+        n_threads (int): Number of threads the predictor uses per call.
+    Returns:
+        tl2cgen.Predictor: The loaded model, returning one probability per
+            class for each row.
+    """
+    import tl2cgen
+
+    lib_file = model_dir / "model.so"
+    if not lib_file.exists():
+        compile_treelite_model(load_bst_model(model_dir), lib_file)
+
+    print(f"Loading Treelite model from {lib_file}")
+    predictor = tl2cgen.Predictor(str(lib_file), nthread=n_threads)
+    print("Model loaded successfully")
+    return predictor
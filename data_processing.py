@@ -1,32 +1,361 @@
 from collections import Counter
-import math
-from urllib.parse import urlparse
+from functools import lru_cache
+from urllib.parse import urlsplit, uses_params
 import tldextract
 import re
+import numpy as np
 import pandas as pd
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Column order the model was trained with; extract_url_features returns
+# its features in this order
+TRAIN_COLUMNS = [
+    "url_length",
+    "hostname_length",
+    "path_length",
+    "query_length",
+    "num_dots",
+    "num_hyphens",
+    "num_at",
+    "num_question_marks",
+    "num_equals",
+    "num_underscores",
+    "num_ampersands",
+    "num_digits",
+    "has_https",
+    "uses_ip",
+    "num_subdomains",
+    "has_login",
+    "has_secure",
+    "has_account",
+    "has_update",
+    "has_free",
+    "has_lucky",
+    "has_banking",
+    "has_confirm",
+    "has_port",
+    "url_entropy"
+]
+SUSPICIOUS_KEYWORDS = [
+    'login',
+    'secure',
+    'account',
+    'update',
+    'free',
+    'lucky',
+    'banking',
+    'confirm'
+]
+
+# Uses the suffix list bundled with tldextract, so no network fetch or
+# on-disk cache lookup happens at import or per call
+TLD_EXTRACTOR = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=False)
+
+# Matches an http(s) URL whose host is an IPv4 address anywhere in the
+# string, which is how uses_ip was defined when the model was trained
+IP_URL_PATTERN = re.compile(r'http[s]?://(?:\d{1,3}\.){3}\d{1,3}')
+
+# Features that only depend on the characters of the URL, in the order
+# produced by scan_url and scan_url_bytes; the remaining columns need the
+# parsed URL
+SCAN_COLUMNS = [
+    "num_dots",
+    "num_hyphens",
+    "num_at",
+    "num_question_marks",
+    "num_equals",
+    "num_underscores",
+    "num_ampersands",
+    "num_digits",
+    "has_https",
+    *(f"has_{keyword}" for keyword in SUSPICIOUS_KEYWORDS),
+    "url_entropy"
+]
+SCAN_INDEX = [TRAIN_COLUMNS.index(column) for column in SCAN_COLUMNS]
+PARSE_INDEX = [
+    i for i, column in enumerate(TRAIN_COLUMNS) if column not in SCAN_COLUMNS
+]
+
+# All keywords compiled into one automaton, so a single pass over the URL
+# finds every keyword it contains
+if ahocorasick is not None:
+    KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for i, keyword in enumerate(SUSPICIOUS_KEYWORDS):
+        KEYWORD_AUTOMATON.add_word(keyword, i)
+    KEYWORD_AUTOMATON.make_automaton()
+else:
+    KEYWORD_AUTOMATON = None
+
+PUNCTUATION_CODES = np.frombuffer(b'.-@?=_&', dtype=np.uint8)
+KEYWORD_CODES = np.frombuffer(
+    ''.join(SUSPICIOUS_KEYWORDS).encode('ascii'), dtype=np.uint8
+)
+KEYWORD_OFFSETS = np.cumsum([0] + [len(k) for k in SUSPICIOUS_KEYWORDS])
+
 
 def shannon_entropy(s):
     """
-    Calculates the Shannon entropy of a given sequence.
+    Calculates the Shannon entropy of a given string.
 
     Shannon entropy is a measure of the unpredictability or information
     content in a sequence. It is commonly used in information theory to
     quantify the diversity of elements in a dataset.
 
+    The character histogram is built with NumPy rather than in Python;
+    ASCII strings (the common case for URLs) are counted as bytes with
+    `np.bincount`, anything else by Unicode code point.
+
     Parameters:
-        s (iterable): The input sequence (e.g., string, list) whose
-            entropy is to be calculated.
+        s (str): The input string whose entropy is to be calculated.
 
     Returns:
-        float: The Shannon entropy value of the sequence.
+        float: The Shannon entropy value of the string.
 
     Example:
         >>> shannon_entropy("hello")
         1.9219280948873623
     """
-    p, lns = Counter(s), float(len(s))
-    return -sum(count/lns * math.log2(count/lns) for count in p.values())
+    if not s:
+        return 0.0
+    if s.isascii():
+        codes = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+        counts = np.bincount(codes)
+        counts = counts[counts > 0]
+    else:
+        codes = np.frombuffer(s.encode('utf-32-le'), dtype=np.uint32)
+        counts = np.unique(codes, return_counts=True)[1]
+    return counts_entropy(counts, len(s))
+
+
+def counts_entropy(counts, total):
+    """
+    Calculates the Shannon entropy from character counts.
+
+    Parameters:
+        counts (numpy.ndarray): The non-zero count of each distinct
+            character.
+        total (int): The length of the sequence the counts come from.
+
+    Returns:
+        float: The Shannon entropy value.
+    """
+    if not total:
+        return 0.0
+    p = counts / total
+    return float(-(p * np.log2(p)).sum())
+
+
+def find_keywords(url_lower):
+    """
+    Flags which of SUSPICIOUS_KEYWORDS occur in a lowercased URL.
+
+    Uses the Aho-Corasick KEYWORD_AUTOMATON when pyahocorasick is installed,
+    otherwise one substring search per keyword.
+
+    Parameters:
+        url_lower (str): The lowercased URL string.
+
+    Returns:
+        list of bool: One flag per keyword, in SUSPICIOUS_KEYWORDS order.
+    """
+    if KEYWORD_AUTOMATON is None:
+        return [keyword in url_lower for keyword in SUSPICIOUS_KEYWORDS]
+
+    found = [False] * len(SUSPICIOUS_KEYWORDS)
+    for _, i in KEYWORD_AUTOMATON.iter(url_lower):
+        found[i] = True
+    return found
+
+
+def scan_url(url):
+    """
+    Computes the SCAN_COLUMNS features of a URL in pure Python.
+
+    The character counts, digit count and entropy all come from a single
+    `Counter` pass over the URL.
+
+    Parameters:
+        url (str): The URL string to scan.
+
+    Returns:
+        list: The feature values, in SCAN_COLUMNS order.
+    """
+    url_lower = url.lower()
+    counts = Counter(url)
+    return [
+        counts['.'],
+        counts['-'],
+        counts['@'],
+        counts['?'],
+        counts['='],
+        counts['_'],
+        counts['&'],
+        sum(n for c, n in counts.items() if c.isdigit()),
+        url_lower.startswith('https'),
+        *find_keywords(url_lower),
+        counts_entropy(
+            np.fromiter(counts.values(), dtype=np.int64, count=len(counts)),
+            len(url)
+        )
+    ]
+
+
+if njit is not None:
+    @njit(cache=True)
+    def scan_url_bytes(codes, offsets, punctuation, keywords, keyword_offsets):
+        """
+        Numba-compiled counterpart of `scan_url` for many ASCII URLs.
+
+        Parameters:
+            codes (numpy.ndarray): The uint8 bytes of all URLs, concatenated.
+            offsets (numpy.ndarray): Start offset of each URL in `codes`,
+                followed by the total length.
+            punctuation (numpy.ndarray): The bytes to count, see
+                PUNCTUATION_CODES.
+            keywords (numpy.ndarray): The lowercase keyword bytes,
+                concatenated, see KEYWORD_CODES.
+            keyword_offsets (numpy.ndarray): Start offset of each keyword in
+                `keywords`, followed by the total length.
+
+        Returns:
+            numpy.ndarray: One row per URL with the SCAN_COLUMNS features.
+        """
+        n_punctuation = punctuation.size
+        n_keywords = keyword_offsets.size - 1
+        scan = np.zeros((offsets.size - 1, n_punctuation + n_keywords + 3))
+        counts = np.empty(128, dtype=np.int64)
+
+        lower = codes.copy()
+        for i in range(lower.size):
+            if 65 <= lower[i] <= 90:
+                lower[i] += 32
+
+        for row in range(offsets.size - 1):
+            start = offsets[row]
+            end = offsets[row + 1]
+            n = end - start
+
+            counts[:] = 0
+            for i in range(start, end):
+                counts[codes[i]] += 1
+
+            col = 0
+            for c in punctuation:
+                scan[row, col] = counts[c]
+                col += 1
+            scan[row, col] = counts[48:58].sum()
+            col += 1
+
+            # 'https' prefix
+            scan[row, col] = (
+                n >= 5 and lower[start] == 104 and lower[start + 1] == 116
+                and lower[start + 2] == 116 and lower[start + 3] == 112
+                and lower[start + 4] == 115
+            )
+            col += 1
+
+            for k in range(n_keywords):
+                k_start = keyword_offsets[k]
+                k_len = keyword_offsets[k + 1] - k_start
+                for i in range(start, end - k_len + 1):
+                    j = 0
+                    while j < k_len and lower[i + j] == keywords[k_start + j]:
+                        j += 1
+                    if j == k_len:
+                        scan[row, col] = 1
+                        break
+                col += 1
+
+            entropy = 0.0
+            for c in range(128):
+                if counts[c] > 0:
+                    p = counts[c] / n
+                    entropy -= p * np.log2(p)
+            scan[row, col] = entropy
+
+        return scan
+else:
+    scan_url_bytes = None
+
+
+def scan_urls(urls):
+    """
+    Computes the SCAN_COLUMNS features of several URLs.
+
+    ASCII URLs are concatenated and scanned in a single call to the
+    compiled `scan_url_bytes` kernel when Numba is installed; all other
+    URLs go through `scan_url`.
+
+    Parameters:
+        urls (list of str): The URL strings to scan.
+
+    Returns:
+        numpy.ndarray: One row per URL with the SCAN_COLUMNS features.
+    """
+    scan = np.empty((len(urls), len(SCAN_COLUMNS)))
+    ascii_rows = []
+    for i, url in enumerate(urls):
+        if scan_url_bytes is not None and url.isascii():
+            ascii_rows.append(i)
+        else:
+            scan[i] = scan_url(url)
+    if ascii_rows:
+        ascii_urls = [urls[i] for i in ascii_rows]
+        codes = np.frombuffer(''.join(ascii_urls).encode('ascii'), np.uint8)
+        offsets = np.cumsum([0] + [len(url) for url in ascii_urls])
+        scan[ascii_rows] = scan_url_bytes(
+            codes, offsets, PUNCTUATION_CODES, KEYWORD_CODES, KEYWORD_OFFSETS
+        )
+    return scan
+
+
+@lru_cache(maxsize=10000)
+def count_subdomains(host):
+    """
+    Counts the subdomains of a hostname (or URL), e.g. 2 for
+    "a.b.example.co.uk". Results are memoized since the same hosts recur
+    across requests.
+
+    Parameters:
+        host (str): The hostname or URL to inspect.
+
+    Returns:
+        int: The number of dot-separated labels in the subdomain.
+    """
+    subdomain = TLD_EXTRACTOR(host).subdomain
+    return len(subdomain.split('.')) if subdomain else 0
+
+
+def path_length(parsed):
+    """
+    Returns the length of a URL's path as `urlparse` reports it.
+
+    URLs are split with the lighter `urlsplit`, which keeps the ";params"
+    of the last path segment in the path, whereas the model was trained
+    on `urlparse` paths that exclude them.
+
+    Parameters:
+        parsed (urllib.parse.SplitResult): The split URL.
+
+    Returns:
+        int: The length of the path without its trailing params.
+    """
+    path = parsed.path
+    if parsed.scheme not in uses_params or ';' not in path:
+        return len(path)
+    if '/' in path:
+        params = path.find(';', path.rfind('/'))
+        return len(path) if params < 0 else params
+    return path.find(';')
 
 
 def extract_url_features(url):
@@ -39,8 +368,9 @@ def extract_url_features(url):
         The URL string to extract features from.
     Returns
     -------
-    pandas.Series
-        A Series containing the following features:
+    numpy.ndarray
+        A float32 array holding the following features, in TRAIN_COLUMNS
+        order:
             - url_length: Length of the entire URL.
             - hostname_length: Length of the hostname part.
             - path_length: Length of the path part.
@@ -61,51 +391,96 @@ def extract_url_features(url):
             - has_port: 1 if a port is specified in the hostname, 0 otherwise.
             - url_entropy: Shannon entropy of the URL string.
     """
-    parsed = urlparse(url)
-    ext = tldextract.extract(url)
+    return extract_url_features_array([url])[0]
 
-    hostname = parsed.netloc
-    path = parsed.path
-    query = parsed.query
-
-    features = {}
-    features['url_length'] = len(url)
-    features['hostname_length'] = len(hostname)
-    features['path_length'] = len(path)
-    features['query_length'] = len(query)
-
-    features['num_dots'] = url.count('.')
-    features['num_hyphens'] = url.count('-')
-    features['num_at'] = url.count('@')
-    features['num_question_marks'] = url.count('?')
-    features['num_equals'] = url.count('=')
-    features['num_underscores'] = url.count('_')
-    features['num_ampersands'] = url.count('&')
-    features['num_digits'] = sum(c.isdigit() for c in url)
-
-    features['has_https'] = int(url.lower().startswith('https'))
-    features['uses_ip'] = int(
-        bool(re.search(r'http[s]?://(?:\d{1,3}\.){3}\d{1,3}', url))
-    )
 
-    features['num_subdomains'] = (
-        len(ext.subdomain.split('.')) if ext.subdomain else 0
-    )
+def parse_features(url):
+    """
+    Computes the features of a URL that need it to be parsed.
+
+    Parameters:
+        url (str): The URL string.
+
+    Returns:
+        list: The feature values, in the order of PARSE_INDEX.
 
-    suspicious_keywords = [
-        'login',
-        'secure',
-        'account',
-        'update',
-        'free',
-        'lucky',
-        'banking',
-        'confirm'
+    Raises:
+        ValueError: If the URL cannot be parsed.
+    """
+    parsed = urlsplit(url)
+    return [
+        len(url),
+        len(parsed.netloc),
+        path_length(parsed),
+        len(parsed.query),
+        IP_URL_PATTERN.search(url) is not None,
+        count_subdomains(parsed.hostname or url),
+        ':' in parsed.netloc
     ]
-    for keyword in suspicious_keywords:
-        features[f'has_{keyword}'] = int(keyword in url.lower())
 
-    features['has_port'] = int(':' in hostname)
-    features['url_entropy'] = shannon_entropy(url)
 
-    return pd.Series(features)
+def extract_url_features_array(urls, failures=None):
+    """
+    Extracts the features of several URLs into one float32 array.
+
+    The parsed-URL features are computed per URL and the character-level
+    features for all URLs with a single `scan_urls` call, written straight
+    into a preallocated array that can be passed to the model as is.
+    Parameters
+    ----------
+    urls : list of str
+        The URL strings to extract features from.
+    failures : dict, optional
+        If given, a URL that cannot be parsed does not raise; instead its
+        position in `urls` is mapped to the exception here and its row is
+        filled with NaN.
+    Returns
+    -------
+    numpy.ndarray
+        A C-contiguous float32 array with one row per URL and the columns of
+        TRAIN_COLUMNS. See `extract_url_features` for the feature
+        definitions.
+    Raises
+    ------
+    ValueError
+        If a URL cannot be parsed and `failures` is not given.
+    """
+    features = np.empty((len(urls), len(TRAIN_COLUMNS)), dtype=np.float32)
+    if not urls:
+        return features
+
+    if failures is None:
+        parsed = [parse_features(url) for url in urls]
+    else:
+        parsed = []
+        for i, url in enumerate(urls):
+            try:
+                parsed.append(parse_features(url))
+            except Exception as e:
+                failures[i] = e
+                parsed.append([np.nan] * len(PARSE_INDEX))
+    features[:, PARSE_INDEX] = parsed
+    features[:, SCAN_INDEX] = scan_urls(urls)
+    return features
+
+
+def extract_url_features_batch(urls):
+    """
+    Extracts the features of a Series of URLs into a DataFrame, for pandas
+    callers such as offline scoring. Wraps `extract_url_features_array`.
+    Parameters
+    ----------
+    urls : pandas.Series
+        A Series of URL strings.
+    Returns
+    -------
+    pandas.DataFrame
+        A float32 DataFrame with one row per URL (sharing the index of
+        `urls`) and the columns of TRAIN_COLUMNS, in order. See
+        `extract_url_features` for the feature definitions.
+    """
+    return pd.DataFrame(
+        extract_url_features_array(urls.tolist()),
+        index=urls.index,
+        columns=TRAIN_COLUMNS
+    )
@@ -0,0 +1,23 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+# With several workers, each one keeps its own Prometheus metrics. Setting
+# PROMETHEUS_MULTIPROC_DIR makes them write their values to files in that
+# directory, which /metrics aggregates across workers. The directory is
+# emptied here, before the app is loaded, so values from a previous run
+# are not counted.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker):
+    """
+    Gunicorn hook called in the master when a worker exits; marks the
+    worker's metric files as dead so its live gauges are dropped.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
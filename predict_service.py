@@ -1,15 +1,25 @@
+import asyncio
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import unquote
 
-import pandas as pd
-import xgboost as xgb
-from data_ingestion import download_and_extract_from_s3, load_bst_model
-from data_processing import extract_url_features
-from fastapi import FastAPI, HTTPException
+import numpy as np
+from data_ingestion import (
+    download_and_extract_from_s3, find_bst_model, load_bst_model,
+    load_onnx_model, load_treelite_model
+)
+from data_processing import TRAIN_COLUMNS, extract_url_features_array
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from prometheus_fastapi_instrumentator import Instrumentator
 from services import publish_prediction
 
+try:
+    import tl2cgen
+except ImportError:
+    tl2cgen = None
+
 # This functions when utilizing an AWS EC2 cluster with the provisioned roles
 MODEL_S3_BUCKET = os.environ.get("MODEL_S3_BUCKET", "malicious-url-project")
 MODEL_S3_KEY = os.environ.get(
@@ -19,36 +29,26 @@ MODEL_S3_KEY = os.environ.get(
         "sagemaker-xgboost-2025-08-09-22-58-52-766/output/model.tar.gz"
     )
 )
-LOCAL_MODEL_DIR = Path("/tmp/modeldir")
-LOCAL_MODEL_DIR.mkdir(parents=True, exist_ok=True)
-
-TRAIN_COLUMNS = [
-    "url_length",
-    "hostname_length",
-    "path_length",
-    "query_length",
-    "num_dots",
-    "num_hyphens",
-    "num_at",
-    "num_question_marks",
-    "num_equals",
-    "num_underscores",
-    "num_ampersands",
-    "num_digits",
-    "has_https",
-    "uses_ip",
-    "num_subdomains",
-    "has_login",
-    "has_secure",
-    "has_account",
-    "has_update",
-    "has_free",
-    "has_lucky",
-    "has_banking",
-    "has_confirm",
-    "has_port",
-    "url_entropy"
-]
+# Extracted models are kept across restarts; mount LOCAL_MODEL_DIR on a
+# persistent or shared volume to reuse them between containers
+LOCAL_MODEL_DIR = Path(os.environ.get("LOCAL_MODEL_DIR", "/tmp/modeldir"))
+
+# S3 objects are immutable per key, so each bucket/key pair is extracted
+# into its own subdirectory, with a marker file written once extraction
+# has completed
+MODEL_TAG = hashlib.sha1(
+    f"{MODEL_S3_BUCKET}/{MODEL_S3_KEY}".encode()
+).hexdigest()[:12]
+MODEL_DIR = LOCAL_MODEL_DIR / MODEL_TAG
+MODEL_DIR.mkdir(parents=True, exist_ok=True)
+MODEL_MARKER = MODEL_DIR / f".{MODEL_TAG}.ok"
+
+# Runtime used to score the model: "xgboost" (the Booster itself), "onnx"
+# (ONNX Runtime) or "treelite" (native code compiled with Treelite); the
+# latter two are converted from the Booster on first startup and need the
+# packages in requirements-backends.txt
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "xgboost")
+
 LABEL_MAPPING = {
     0: "benign",
     1: "phishing",
@@ -56,41 +56,230 @@ LABEL_MAPPING = {
     3: "defacement"
 }
 
+# Concurrent /predict requests are coalesced into batches of at most
+# MAX_BATCH_SIZE URLs, waiting no longer than BATCH_WAIT_TIMEOUT_S for a
+# batch to fill before it is scored
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "64"))
+BATCH_WAIT_TIMEOUT_S = float(os.environ.get("BATCH_WAIT_TIMEOUT_S", "0.01"))
+
+# Threads the model uses per prediction; small batches are latency bound,
+# so a single thread avoids contention between concurrent predictions
+XGB_NTHREAD = int(os.environ.get("XGB_NTHREAD", "1"))
+
 app = FastAPI(title="Malicious URL Detection Service")
 MODEL = None
+BATCH_QUEUE = None
+BATCH_TASK = None
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
 
 Instrumentator().instrument(app).expose(app)
 
 
+def load_model():
+    """
+    Downloads and extracts a model file from an S3 bucket, then loads the
+    model for `MODEL_BACKEND` into the global variable `MODEL`.
+
+    The download is skipped if the same S3 object was already extracted
+    into `MODEL_DIR`, and the model is pinned to `XGB_NTHREAD` threads.
+
+    Raises:
+        Exception: If downloading, extracting, or loading the model fails.
+    """
+    global MODEL
+    if MODEL_MARKER.exists() and find_bst_model(MODEL_DIR) is not None:
+        print(f"Using previously extracted model in {MODEL_DIR}")
+    else:
+        download_and_extract_from_s3(MODEL_S3_BUCKET, MODEL_S3_KEY, MODEL_DIR)
+        MODEL_MARKER.touch()
+
+    if MODEL_BACKEND == "xgboost":
+        MODEL = load_bst_model(MODEL_DIR)
+        MODEL.set_param({"nthread": XGB_NTHREAD})
+    elif MODEL_BACKEND == "onnx":
+        MODEL = load_onnx_model(MODEL_DIR, n_threads=XGB_NTHREAD)
+    elif MODEL_BACKEND == "treelite":
+        MODEL = load_treelite_model(MODEL_DIR, n_threads=XGB_NTHREAD)
+    else:
+        raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND}")
+
+
 @app.on_event("startup")
 def load_model_startup():
     """
     Event handler for FastAPI application startup.
 
-    This function downloads and extracts a model file from an S3 bucket,
-    then loads the model into the global variable `MODEL`. If any error occurs
-    during the process, it prints the error and raises the exception.
+    Loads the model with `load_model`, unless it was already loaded before
+    the worker was forked (see `PRELOAD_MODEL`), then warms it up with a
+    dummy prediction so the first request does not pay for lazy
+    initialization. If any error occurs during the process, it prints the
+    error and raises the exception.
 
     Raises:
         Exception: If downloading, extracting, or loading the model fails.
     """
-    global MODEL
     try:
-        download_and_extract_from_s3(
-            MODEL_S3_BUCKET, MODEL_S3_KEY, LOCAL_MODEL_DIR
-        )
-        MODEL = load_bst_model(LOCAL_MODEL_DIR)
+        if MODEL is None:
+            load_model()
+        predict_classes(np.zeros((1, len(TRAIN_COLUMNS)), dtype=np.float32))
     except Exception as e:
         print("Error loading model:", e)
         raise
 
 
+@app.on_event("startup")
+async def start_batch_worker():
+    """
+    Event handler for FastAPI application startup.
+
+    Creates the request queue and starts the background task that
+    batches queued URLs and scores them with the model. Feature extraction
+    is run once on a dummy URL so the Numba kernel (if installed) is
+    compiled before the first request.
+    """
+    global BATCH_QUEUE, BATCH_TASK
+    extract_url_features_array(["https://example.com"])
+    BATCH_QUEUE = asyncio.Queue()
+    BATCH_TASK = asyncio.create_task(batch_worker())
+
+
+def to_class_indices(preds):
+    """
+    Converts raw model output to one class index per row.
+
+    Models trained with `multi:softmax` return the class index directly,
+    while `multi:softprob` returns one probability per class, in which case
+    the most likely class is taken.
+    Args:
+        preds (numpy.ndarray): The model output for a batch.
+    Returns:
+        numpy.ndarray: The predicted class index for each row.
+    """
+    preds = np.asarray(preds)
+    if preds.ndim > 1 and preds.shape[-1] > 1:
+        return preds.argmax(axis=-1).reshape(-1)
+    return preds.reshape(-1).astype(int)
+
+
+def predict_classes(features):
+    """
+    Scores a feature matrix with `MODEL` using the configured backend.
+    Args:
+        features (numpy.ndarray): A C-contiguous float32 array with one row
+            per URL and the columns of TRAIN_COLUMNS.
+    Returns:
+        numpy.ndarray: The predicted class index for each row.
+    """
+    if MODEL_BACKEND == "onnx":
+        preds = MODEL.run(None, {"input": features})[0]
+    elif MODEL_BACKEND == "treelite":
+        preds = MODEL.predict(tl2cgen.DMatrix(features))
+    else:
+        preds = MODEL.inplace_predict(features)
+    return to_class_indices(preds)
+
+
+def predict_batch(urls):
+    """
+    Predicts the class labels of several URLs in a single model call.
+
+    The feature matrix is handed to the model as a float32 array; for the
+    XGBoost backend this uses `Booster.inplace_predict`, which reads the
+    array directly instead of copying it into a DMatrix. URLs that cannot
+    be parsed are left out of the model call, so they only fail their own
+    prediction.
+    Args:
+        urls (list of str): The decoded URLs to classify.
+    Returns:
+        list: For each URL, in input order, its predicted class label, or
+            the exception raised while extracting its features.
+    Raises:
+        Exception: If scoring the batch with the model fails.
+    """
+    failures = {}
+    features = extract_url_features_array(urls, failures=failures)
+    results = [failures.get(i) for i in range(len(urls))]
+
+    valid = [i for i in range(len(urls)) if i not in failures]
+    if not valid:
+        return results
+    if failures:
+        features = features[valid]
+
+    preds = predict_classes(features)
+    for i, pred in zip(valid, preds):
+        results[i] = LABEL_MAPPING.get(int(pred), "unknown")
+    return results
+
+
+async def batch_worker():
+    """
+    Drains `BATCH_QUEUE`, scoring URLs in batches.
+
+    Waits for a first request, then keeps collecting requests until either
+    `MAX_BATCH_SIZE` is reached or `BATCH_WAIT_TIMEOUT_S` has elapsed. The
+    batch is scored in `BATCH_EXECUTOR` so the event loop stays responsive,
+    and each caller's future is resolved with its own label. A URL that
+    cannot be parsed fails only its own future, while an error from the
+    model itself is passed to every future in the batch.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await BATCH_QUEUE.get()]
+        deadline = loop.time() + BATCH_WAIT_TIMEOUT_S
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(BATCH_QUEUE.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+
+        urls = [url for url, _ in batch]
+        try:
+            results = await loop.run_in_executor(
+                BATCH_EXECUTOR, predict_batch, urls
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def publish_result(result):
+    """
+    Publishes a prediction result to Kafka, logging rather than raising
+    any error so a broker problem never affects the prediction response.
+    Args:
+        result (dict): The prediction result to publish.
+    """
+    try:
+        publish_prediction(result)
+    except Exception as pub_exc:
+        print(f"Kafka publish error: {pub_exc}")
+
+
 @app.get("/predict/{url:path}")
-def predict_url(url: str):
+async def predict_url(url: str, background_tasks: BackgroundTasks):
     """
     Predicts the class of a given URL using a pre-trained XGBoost model.
+
+    The URL is queued for the batch worker and scored together with any
+    other requests that arrive within the batching window. The result is
+    published to Kafka after the response has been sent.
     Args:
         url (str): The URL path parameter, which will be decoded and processed.
+        background_tasks (BackgroundTasks): Tasks FastAPI runs after
+            sending the response.
     Returns:
         dict: A dictionary containing the decoded URL and its predicted
             class label.
@@ -104,25 +293,26 @@ def predict_url(url: str):
 
     try:
         decoded_url = unquote(url)
-        features = extract_url_features(decoded_url)
-
-        # Enforce feature column order
-        features = features[TRAIN_COLUMNS]
-
-        dmatrix = xgb.DMatrix(pd.DataFrame([features]))
-        pred_class = int(MODEL.predict(dmatrix)[0])
+        future = asyncio.get_running_loop().create_future()
+        await BATCH_QUEUE.put((decoded_url, future))
+        predicted_class = await future
 
         result = {
             "url": decoded_url,
-            "predicted_class": LABEL_MAPPING.get(pred_class, "unknown")
+            "predicted_class": predicted_class
         }
 
-        # Publish result to Kafka topic (non-blocking, errors ignored)
-        try:
-            publish_prediction(result)
-        except Exception as pub_exc:
-            print(f"Kafka publish error: {pub_exc}")
+        # Publish result to Kafka topic once the response is sent
+        background_tasks.add_task(publish_result, result)
 
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# Under `gunicorn --preload` this module is imported once in the master
+# process before the workers are forked, so loading the model here lets
+# all workers share one copy of it (copy-on-write) rather than each
+# downloading and loading their own. The warm-up still runs per worker.
+if os.environ.get("PRELOAD_MODEL") == "1":
+    load_model()
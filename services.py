@@ -1,28 +1,56 @@
-import json
+import atexit
 import os
+import threading
 
+import orjson
 from kafka import KafkaConsumer, KafkaProducer
 
 KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "localhost:9092")
 PREDICTION_TOPIC = os.environ.get("PREDICTION_TOPIC", "url_predictions")
 
+PRODUCER = None
+PRODUCER_LOCK = threading.Lock()
+# Upper bound on how long process exit waits for unsent messages
+PRODUCER_CLOSE_TIMEOUT_S = 5
+
 
 def get_producer():
-    return KafkaProducer(
-        bootstrap_servers=KAFKA_BROKER,
-        value_serializer=lambda v: json.dumps(v).encode("utf-8")
-    )
+    """
+    Returns the process-wide Kafka producer, creating it on first use.
+
+    The producer keeps its broker connection open and batches messages
+    (up to `linger_ms` / `batch_size`), so it is shared rather than created
+    per message. When the process exits the producer is closed, waiting at
+    most `PRODUCER_CLOSE_TIMEOUT_S` seconds for pending messages to be sent.
+    Returns:
+        KafkaProducer: The shared producer.
+    """
+    global PRODUCER
+    if PRODUCER is None:
+        with PRODUCER_LOCK:
+            if PRODUCER is None:
+                PRODUCER = KafkaProducer(
+                    bootstrap_servers=KAFKA_BROKER,
+                    value_serializer=orjson.dumps,
+                    linger_ms=5,
+                    batch_size=65536,
+                    acks=1,
+                    compression_type="lz4"
+                )
+                atexit.register(PRODUCER.close, timeout=PRODUCER_CLOSE_TIMEOUT_S)
+    return PRODUCER
 
 
 def publish_prediction(prediction: dict):
     """
     Publishes a prediction result to the Kafka topic.
+
+    The message is queued on the shared producer and sent in the
+    background; this does not wait for the broker to acknowledge it.
     Args:
         prediction (dict): The prediction result to publish.
     """
-    producer = get_producer()
-    producer.send(PREDICTION_TOPIC, prediction)
-    producer.flush()
+    get_producer().send(PREDICTION_TOPIC, prediction)
 
 
 def get_consumer(topic=PREDICTION_TOPIC, group_id="url-prediction-group"):
@@ -30,7 +58,7 @@ def get_consumer(topic=PREDICTION_TOPIC, group_id="url-prediction-group"):
         topic,
         bootstrap_servers=KAFKA_BROKER,
         group_id=group_id,
-        value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+        value_deserializer=orjson.loads,
         auto_offset_reset="earliest",
         enable_auto_commit=True
     )